@@ -1,28 +1,81 @@
 import subprocess
 import pandas as pd
-import re
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
-import io
 import logging
 import os
 import shutil
+import signal
 from dotenv import load_dotenv
 import traceback
-import matplotlib.pyplot as plt
-from PIL import Image
-import base64
-import json
+import orjson
+import functools
+import argparse
+import sched
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Load environment variables from .env file
 load_dotenv()
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+# Optional: with a machine token, metrics come straight from the Pantheon API instead of a terminus process per site
+PANTHEON_MACHINE_TOKEN = os.getenv("PANTHEON_MACHINE_TOKEN")
+PANTHEON_API_URL = "https://terminus.pantheon.io/api"
+API_AUTH_RETRY_SECONDS = 300  # after a failed login, use terminus for this long before trying the API again
 SLACK_CHANNEL = "#pantheonmetricsalerts"
 ENV = "live"
 YAML_FILE = "sites.yaml"
 LOG_FILE = "metricsmonitoring.log"
 ALERT_LOG_FILE = "alert_log.json"
+MAX_WORKERS = 32  # terminus calls are I/O-bound; returns diminish past this
+SLACK_MAX_BLOCKS = 50  # Slack rejects messages with more blocks than this
+
+# Prefer the LibYAML C loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_CONFIG_CACHE = {}
+# terminus and the Pantheon API emit machine names in JSON output; map them back to the table labels used below
+METRICS_COLUMNS = {
+    "period": "Period",
+    "datetime": "Period",
+    "visits": "Visits",
+    "pages_served": "Pages Served",
+    "cache_hits": "Cache Hits",
+    "cache_misses": "Cache Misses",
+    "cache_hit_ratio": "Cache Hit Ratio",
+    "http_4xx": "HTTP 4xx",
+    "http_5xx": "HTTP 5xx",
+}
+NUMERIC_COLUMNS = ["Visits", "Pages Served", "Cache Hits", "Cache Misses", "HTTP 4xx", "HTTP 5xx"]
+
+# Shared HTTP session (Slack + Pantheon API): keeps TLS connections alive and retries rate-limited/failed API calls
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503],
+        # POST is only the API login, which is safe to repeat
+        allowed_methods=frozenset(["GET", "POST"]),
+    ),
+))
+# Slack webhooks aren't idempotent: a 5xx or read timeout may come after Slack already posted the
+# message, so only retry rate limiting (429, honouring Retry-After) and never re-send after a read error
+HTTP_SESSION.mount("https://hooks.slack.com/", HTTPAdapter(
+    max_retries=Retry(
+        total=3,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[429],
+        allowed_methods=None,
+    ),
+))
 
 logging.basicConfig(
     filename=LOG_FILE,
@@ -31,16 +84,48 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S"
 )
 
+@functools.lru_cache(maxsize=None)
 def resolve_terminus_command():
     terminus_cmd = shutil.which("terminus") or os.getenv("TERMINUS_COMMAND")
     if not terminus_cmd:
         raise FileNotFoundError("Could not find 'terminus' command and 'TERMINUS_COMMAND' is not set.")
     return terminus_cmd
 
+# Shared across worker threads; the lock makes sure only one of them logs in at a time
+_API_SESSION = {"token": None, "expires_at": 0, "retry_at": 0}
+_API_SESSION_LOCK = threading.Lock()
+
+def get_api_session_token(stale_token=None):
+    # Exchange the machine token for a session token like `terminus auth:login` does, reusing it until it expires
+    with _API_SESSION_LOCK:
+        now = time.time()
+        if _API_SESSION["token"] and _API_SESSION["token"] != stale_token and now < _API_SESSION["expires_at"] - 60:
+            return _API_SESSION["token"]
+        if now < _API_SESSION["retry_at"]:
+            raise RuntimeError("Pantheon API login failed recently.")
+        try:
+            response = HTTP_SESSION.post(
+                f"{PANTHEON_API_URL}/authorize/machine-token",
+                json={"machine_token": PANTHEON_MACHINE_TOKEN, "client": "terminus"},
+                timeout=10,
+            )
+            response.raise_for_status()
+            session = response.json()
+        except Exception:
+            _API_SESSION.update(token=None, retry_at=now + API_AUTH_RETRY_SECONDS)
+            raise
+        _API_SESSION.update(token=session["session"], expires_at=session.get("expires_at", now + 3600), retry_at=0)
+        return _API_SESSION["token"]
+
 def load_config(yaml_file):
-    with open(yaml_file, "r") as f:
-        config = yaml.safe_load(f)
-    return config.get("sites_to_monitor", []), config.get("threshold_percent", 25)
+    # Only reparse the YAML when the file has changed since the last load
+    key = (yaml_file, os.stat(yaml_file).st_mtime_ns)
+    if key not in _CONFIG_CACHE:
+        with open(yaml_file, "r") as f:
+            config = yaml.load(f, Loader=YAML_LOADER)
+        _CONFIG_CACHE.clear()
+        _CONFIG_CACHE[key] = (config.get("sites_to_monitor", []), config.get("threshold_percent", 25))
+    return _CONFIG_CACHE[key]
 
 def send_slack_notification(message, blocks=None):
     if not SLACK_WEBHOOK_URL or "hooks.slack.com/services/" not in SLACK_WEBHOOK_URL:
@@ -50,7 +135,12 @@ def send_slack_notification(message, blocks=None):
     if blocks:
         payload["blocks"] = blocks
     try:
-        response = requests.post(SLACK_WEBHOOK_URL, json=payload)
+        response = HTTP_SESSION.post(
+            SLACK_WEBHOOK_URL,
+            data=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=5,
+        )
         if response.status_code == 200:
             logging.info("Slack notification sent successfully.")
             print("Slack notification sent successfully.")
@@ -67,25 +157,64 @@ def send_slack_notification(message, blocks=None):
 def get_sites(sites_to_monitor):
     try:
         terminus_cmd = resolve_terminus_command()
-        result = subprocess.run(
-            [terminus_cmd, "site:list", "--format=csv"],
-            capture_output=True, text=True, check=True
-        )
-        df = pd.read_csv(io.StringIO(result.stdout))
+        command = [terminus_cmd, "site:list", "--format=csv"]
+        parse_error = None
+        # stderr goes to a file so it can't fill a second pipe while pandas reads stdout
+        with tempfile.TemporaryFile() as stderr_file:
+            # Let pandas read the pipe directly instead of buffering the whole CSV as a string first
+            with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file) as proc:
+                try:
+                    df = pd.read_csv(proc.stdout)
+                except Exception as e:
+                    # terminus may still be blocked writing to the pipe; stop it so waiting can't hang
+                    parse_error = e
+                    proc.kill()
+            # A failed terminus call should be reported as such, not as a CSV parse error
+            if proc.returncode and not (parse_error and proc.returncode == -signal.SIGKILL):
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode(errors="replace").strip()
+                raise subprocess.CalledProcessError(proc.returncode, command, stderr=stderr)
+        if parse_error:
+            raise parse_error
         return df[df["Name"].isin(sites_to_monitor)]
     except Exception as e:
-        logging.error(f"Error getting sites: {e}")
-        print(f"Error getting sites: {e}")
+        details = f"{e} {e.stderr}" if getattr(e, "stderr", None) else e
+        logging.error(f"Error getting sites: {details}")
+        print(f"Error getting sites: {details}")
         return pd.DataFrame()
 
-def get_metrics(site_name, env, period):
+def get_api_metrics(site_id, env, period):
+    # Same data terminus env:metrics reads ("auto" datapoints is 28 for daily periods)
+    datapoints = {"day": 28, "week": 12, "month": 12}[period]
+    token = get_api_session_token()
+    for attempt in range(2):
+        response = HTTP_SESSION.get(
+            f"{PANTHEON_API_URL}/sites/{site_id}/environments/{env}/traffic",
+            params={"duration": f"{datapoints}{period[0]}"},
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=30,
+        )
+        if response.status_code != 401 or attempt:
+            break
+        # Session expired early or was revoked: log in again once and retry
+        token = get_api_session_token(stale_token=token)
+    response.raise_for_status()
+    return response.text
+
+def get_metrics(site_name, env, period, site_id=None):
     try:
+        if PANTHEON_MACHINE_TOKEN and site_id:
+            try:
+                return get_api_metrics(site_id, env, period)
+            except Exception as e:
+                logging.warning(f"Pantheon API request failed for {site_name}, falling back to terminus: {e}")
+                print(f"Pantheon API request failed for {site_name}, falling back to terminus: {e}")
         terminus_cmd = resolve_terminus_command()
         command = [
             terminus_cmd, "env:metrics",
             "--period", period,
             "--datapoints", "auto",
-            "--format", "table",
+            "--format", "json",
             "--fields", "Period,Visits,Pages Served,Cache Hits,Cache Misses,Cache Hit Ratio,HTTP 4xx,HTTP 5xx",
             "--",
             f"{site_name}.{env}"
@@ -97,224 +226,265 @@ def get_metrics(site_name, env, period):
         print(f"Error getting metrics for {site_name}: {e}")
         return ""
 
-def parse_table_to_df(output):
+def parse_metrics_to_df(output):
     try:
-        lines = output.splitlines()
-        header_idx = next((i for i, line in enumerate(lines) if "Period" in line and "Cache Hit Ratio" in line), None)
-        if header_idx is None:
+        if not output.strip():
             return None
-        header = re.split(r'\s{2,}', lines[header_idx].strip())
-        data = []
-        for line in lines[header_idx+2:]:
-            if not line.strip() or line.strip().startswith("-"):
-                continue
-            row = re.split(r'\s{2,}', line.strip())
-            if len(row) == len(header):
-                data.append(row)
+        data = orjson.loads(output)
+        # API responses wrap the rows in "timeseries"; terminus may key them by timestamp
+        if isinstance(data, dict):
+            data = data.get("timeseries", data)
+        if isinstance(data, dict):
+            data = list(data.values())
         if not data:
             return None
-        df = pd.DataFrame(data, columns=header)
-        for col in ["Visits", "Pages Served", "Cache Hits", "Cache Misses", "HTTP 4xx", "HTTP 5xx"]:
-            if col in df.columns:
-                df[col] = df[col].str.replace(",", "").astype(int)
-        df["Cache Hit Ratio"] = df["Cache Hit Ratio"].str.replace("%", "").astype(float)
+        df = pd.DataFrame(data).rename(columns=METRICS_COLUMNS)
+        # JSON numbers already arrive typed; only formatted strings ("1,234") need one vectorized cleanup pass
+        str_cols = [col for col in NUMERIC_COLUMNS if col in df.columns and not pd.api.types.is_numeric_dtype(df[col])]
+        if str_cols:
+            df[str_cols] = df[str_cols].replace(",", "", regex=True).apply(pd.to_numeric)
+        if "Cache Hit Ratio" not in df.columns and {"Cache Hits", "Cache Misses"} <= set(df.columns):
+            # The raw API leaves the ratio for the client to compute, as terminus does
+            # Periods with no traffic stay NaN so they don't drag the average ratio down
+            served = (df["Cache Hits"] + df["Cache Misses"]).where(lambda total: total > 0)
+            df["Cache Hit Ratio"] = (df["Cache Hits"] / served * 100).round(2)
+        if "Period" not in df.columns or "Cache Hit Ratio" not in df.columns:
+            return None
+        if not pd.api.types.is_numeric_dtype(df["Cache Hit Ratio"]):
+            # Zero-traffic periods come back as "--" and become NaN, same as the computed ratio
+            df["Cache Hit Ratio"] = pd.to_numeric(df["Cache Hit Ratio"].str.rstrip("%"), errors="coerce")
+        df["Cache Hit Ratio"] = df["Cache Hit Ratio"].astype(float)
         try:
             df["Period"] = pd.to_datetime(df["Period"], format="%Y-%m-%d")
         except Exception:
-            pass
+            # terminus reports the period as a full ISO timestamp rather than a bare date
+            df["Period"] = pd.to_datetime(df["Period"]).dt.normalize()
         return df
     except Exception as e:
-        logging.error(f"Error parsing metrics table: {e}")
-        print(f"Error parsing metrics table: {e}")
+        logging.error(f"Error parsing metrics output: {e}")
+        print(f"Error parsing metrics output: {e}")
         return None
 
 def load_alert_log():
     if os.path.exists(ALERT_LOG_FILE):
-        with open(ALERT_LOG_FILE, "r") as f:
-            return json.load(f)
+        with open(ALERT_LOG_FILE, "rb") as f:
+            return orjson.loads(f.read())
     return {}
 
 def save_alert_log(log):
-    with open(ALERT_LOG_FILE, "w") as f:
-        json.dump(log, f)
+    with open(ALERT_LOG_FILE, "wb") as f:
+        f.write(orjson.dumps(log))
 
-def already_alerted(site_name, alert_type, date_str):
-    log = load_alert_log()
+def already_alerted(log, site_name, alert_type, date_str):
     key = f"{site_name}:{alert_type}:{date_str}"
     return log.get(key, False)
 
-def mark_alerted(site_name, alert_type, date_str):
-    log = load_alert_log()
+def mark_alerted(log, site_name, alert_type, date_str):
     key = f"{site_name}:{alert_type}:{date_str}"
     log[key] = True
-    save_alert_log(log)
-
-def send_trend_chart_to_slack(site_name, df, dashboard_url):
-    # Only plot last 14 days for clarity
-    trend_df = df.tail(14)
-    plt.figure(figsize=(8, 3))
-    plt.plot(trend_df["Period"], trend_df["Visits"], marker='o', color='blue')
-    plt.title(f"Visits Trend: {site_name}")
-    plt.xlabel("Date")
-    plt.ylabel("Visits")
-    plt.grid(True)
-    plt.tight_layout()
-    # Save to buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    plt.close()
-    buf.seek(0)
-    # Save locally
-    filename = f"{site_name}_trend.png"
-    with open(filename, "wb") as f:
-        f.write(buf.read())
-    print(f"Saved trend chart for {site_name} as {filename}")
-    # Notify in Slack (image upload via webhook is not supported)
-    send_slack_notification(
-        f"Traffic trend for {site_name} (see attached chart or local file `{filename}`)\n<{dashboard_url}|View in Pantheon Dashboard>"
-    )
-
-def monitor_sites():
+
+def trend_sparkline(series):
+    # Unicode bar chart that renders inline in Slack, no image upload needed
+    bars = "▁▂▃▄▅▆▇█"
+    lo, hi = series.min(), series.max()
+    span = (hi - lo) or 1
+    return "".join(bars[round((v - lo) / span * (len(bars) - 1))] for v in series)
+
+# Block Kit builders: one place for each alert's layout, filled in per site
+CACHE_TIPS_BLOCK = {"type": "section", "text": {"type": "mrkdwn", "text": (
+    "*How to improve caching efficiency:*\n"
+    "• Ensure static assets (images, CSS, JS) are cacheable and have long cache lifetimes.\n"
+    "• Review HTTP headers (`Cache-Control`, `Expires`).\n"
+    "• Avoid unnecessary cache bypass for dynamic pages.\n"
+    "• Use Pantheon’s [Advanced Page Cache](https://pantheon.io/docs/advanced-page-cache).\n"
+    "• Avoid uncacheable cookies or query parameters.\n"
+    "• Audit for personalized content and use `Vary` headers if needed."
+)}}
+
+def mrkdwn_section(text):
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+def mrkdwn_fields(*texts):
+    return {"type": "section", "fields": [{"type": "mrkdwn", "text": text} for text in texts]}
+
+def header_block(text):
+    return {"type": "header", "text": {"type": "plain_text", "text": text}}
+
+def anomaly_blocks(site_name, date_text, recent_visits, avg_visits, percent_increase, threshold_percent, prev_text, sparkline, dashboard_url):
+    return [
+        header_block("🚨 Anomalous Traffic Detected!"),
+        mrkdwn_fields(
+            f"*Site:*\n{site_name} ({ENV})",
+            f"*Date:*\n{date_text}",
+            f"*Recent Visits:*\n{recent_visits:,}",
+            f"*Average (last 5 days):*\n{avg_visits:,.2f}",
+            f"*Increase:*\n{percent_increase:.1f}%",
+            f"*Threshold:*\n{threshold_percent}%",
+        ),
+        mrkdwn_section("*Previous days:*"),
+        {"type": "context", "elements": [{"type": "mrkdwn", "text": prev_text}]},
+        mrkdwn_section(f"*Visits Trend:*\n`{sparkline}`"),
+        mrkdwn_section(f"<{dashboard_url}|View in Pantheon Dashboard>"),
+    ]
+
+def error_rate_blocks(site_name, date_text, recent_4xx, recent_5xx, dashboard_url):
+    return [
+        header_block("🚨 High Error Rate Detected!"),
+        mrkdwn_fields(
+            f"*Site:*\n{site_name} ({ENV})",
+            f"*Date:*\n{date_text}",
+            f"*HTTP 4xx:*\n{recent_4xx:,}",
+            f"*HTTP 5xx:*\n{recent_5xx:,}",
+        ),
+        mrkdwn_section(f"<{dashboard_url}|View in Pantheon Dashboard>"),
+    ]
+
+def cache_efficiency_blocks(site_name, indicator, avg_ratio, impact_text, trend_text, worst_text, dashboard_url):
+    return [
+        header_block(f"{indicator} Low Cache Efficiency Detected!"),
+        mrkdwn_fields(
+            f"*Site:*\n{site_name} ({ENV})",
+            f"*Average Cache Hit Ratio:*\n{avg_ratio:.2f}%",
+            "*Threshold:*\n50%",
+            f"*Origin Requests:*\n{impact_text}",
+        ),
+        mrkdwn_section(f"*Recent Cache Hit Ratios:*\n{trend_text}"),
+        mrkdwn_section(f"*Lowest Ratio in Last 5 Periods:* {worst_text}"),
+        CACHE_TIPS_BLOCK,
+        mrkdwn_section(f"<{dashboard_url}|View in Pantheon Dashboard>"),
+    ]
+
+def queue_blocks(pending_blocks, blocks):
+    # Separate alerts that share a single Slack message with a divider
+    if pending_blocks:
+        pending_blocks.append({"type": "divider"})
+    pending_blocks.extend(blocks)
+
+def fetch_and_parse(site_name, site_id, period):
+    # Runs on a worker thread: only fetch and parse here, alerting stays on the main thread
+    metrics_output = get_metrics(site_name, ENV, period, site_id)
+    return site_name, site_id, parse_metrics_to_df(metrics_output)
+
+def monitor_sites(config=None):
+    alert_log = None
     try:
         print(f"Starting metrics monitoring script (period: day)...")
         logging.info(f"Script started (period: day).")
-        sites_to_monitor, threshold_percent = load_config(YAML_FILE)
+        alert_log = load_alert_log()
+        sites_to_monitor, threshold_percent = config or load_config(YAML_FILE)
         sites_df = get_sites(sites_to_monitor)
         if sites_df.empty:
             logging.warning("No sites found to monitor after filtering.")
             print("No sites found to monitor after filtering.")
-        for _, row in sites_df.iterrows():
-            site_name = row["Name"]
-            site_id = row["ID"]
-            print(f"Checking site: {site_name} ...")
-            logging.info(f"Checking site: {site_name}")
-            metrics_output = get_metrics(site_name, ENV, "day")
-            df = parse_table_to_df(metrics_output)
-            if df is not None and "Visits" in df.columns and len(df) > 4:
-                recent = df.iloc[-1]
-                recent_visits = recent["Visits"]
-                recent_date = recent["Period"].strftime('%Y-%m-%d')
-                recent_day_name = recent["Period"].strftime('%A')
-                dashboard_url = f"https://dashboard.pantheon.io/sites/{site_id}#{ENV}/code"
-
-                # --- Trend Visualization ---
-                send_trend_chart_to_slack(site_name, df, dashboard_url)
-
-                # --- Traffic Spike Alert with Fatigue Prevention ---
-                previous_days = df.iloc[-6:-1]  # last 5 days before today
-                if len(previous_days) >= 3:
-                    avg_visits = previous_days["Visits"].mean()
-                    prev_periods = previous_days["Period"].dt.strftime('%Y-%m-%d').tolist()
-                    prev_visits = previous_days["Visits"].tolist()
-                else:
-                    avg_visits = df["Visits"].iloc[:-1].mean()
-                    prev_periods = df["Period"].iloc[:-1].dt.strftime('%Y-%m-%d').tolist()
-                    prev_visits = df["Visits"].iloc[:-1].tolist()
-
-                percent_increase = ((recent_visits - avg_visits) / avg_visits) * 100 if avg_visits > 0 else 0
-
-                prev_days = [pd.to_datetime(d).strftime('%A') for d in prev_periods]
-                blocks = [
-                    {"type": "header", "text": {"type": "plain_text", "text": "🚨 Anomalous Traffic Detected!"}},
-                    {"type": "section", "fields": [
-                        {"type": "mrkdwn", "text": f"*Site:*\n{site_name} ({ENV})"},
-                        {"type": "mrkdwn", "text": f"*Date:*\n{recent_date} ({recent_day_name})"},
-                        {"type": "mrkdwn", "text": f"*Recent Visits:*\n{recent_visits:,}"},
-                        {"type": "mrkdwn", "text": f"*Average (last 5 days):*\n{avg_visits:,.2f}"},
-                        {"type": "mrkdwn", "text": f"*Increase:*\n{percent_increase:.1f}%"},
-                        {"type": "mrkdwn", "text": f"*Threshold:*\n{threshold_percent}%"},
-                    ]},
-                    {"type": "section", "text": {"type": "mrkdwn", "text": "*Previous days:*"}},
-                    {"type": "context", "elements": [
-                        {"type": "mrkdwn", "text": "\n".join([f"{d} ({day}): {v:,} visits" for d, day, v in zip(prev_periods, prev_days, prev_visits)])}
-                    ]},
-                    {"type": "section", "text": {"type": "mrkdwn", "text": f"<{dashboard_url}|View in Pantheon Dashboard>"}}
-                ]
-                alert_date = recent_date
-                if not already_alerted(site_name, "traffic_spike", alert_date):
-                    if avg_visits > 0 and recent_visits > avg_visits * (1 + threshold_percent / 100):
-                        print(f"Anomaly detected for {site_name}! Sending Slack alert...")
-                        logging.info(f"Anomaly detected for {site_name}: {percent_increase:.1f}% increase. Sending alert.")
-                        send_slack_notification("Anomalous Traffic Detected!", blocks=blocks)
-                        mark_alerted(site_name, "traffic_spike", alert_date)
-                    else:
-                        print(f"No anomaly detected for {site_name}.")
-                        logging.info(f"No anomaly detected for {site_name}.")
-                else:
-                    print(f"Already alerted for traffic spike on {site_name} for {alert_date}.")
-
-                # --- Error/Status Monitoring with Fatigue Prevention ---
-                if "HTTP 4xx" in df.columns and "HTTP 5xx" in df.columns:
-                    recent_4xx = df.iloc[-1]["HTTP 4xx"]
-                    recent_5xx = df.iloc[-1]["HTTP 5xx"]
-                    error_alert_type = "error_rate"
-                    error_threshold_4xx = 100  # Adjust as needed
-                    error_threshold_5xx = 10   # Adjust as needed
-                    if not already_alerted(site_name, error_alert_type, alert_date):
-                        if recent_4xx > error_threshold_4xx or recent_5xx > error_threshold_5xx:
-                            error_blocks = [
-                                {"type": "header", "text": {"type": "plain_text", "text": "🚨 High Error Rate Detected!"}},
-                                {"type": "section", "fields": [
-                                    {"type": "mrkdwn", "text": f"*Site:*\n{site_name} ({ENV})"},
-                                    {"type": "mrkdwn", "text": f"*Date:*\n{recent_date} ({recent_day_name})"},
-                                    {"type": "mrkdwn", "text": f"*HTTP 4xx:*\n{recent_4xx:,}"},
-                                    {"type": "mrkdwn", "text": f"*HTTP 5xx:*\n{recent_5xx:,}"},
-                                ]},
-                                {"type": "section", "text": {"type": "mrkdwn", "text": f"<{dashboard_url}|View in Pantheon Dashboard>"}}
-                            ]
-                            send_slack_notification("High Error Rate Detected!", blocks=error_blocks)
-                            mark_alerted(site_name, error_alert_type, alert_date)
+        with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(sites_df)))) as executor:
+            futures = []
+            for _, row in sites_df.iterrows():
+                print(f"Checking site: {row['Name']} ...")
+                logging.info(f"Checking site: {row['Name']}")
+                futures.append(executor.submit(fetch_and_parse, row["Name"], row["ID"], "day"))
+            for future in as_completed(futures):
+                site_name, site_id, df = future.result()
+                pending_blocks = []
+                pending_titles = []
+                if df is not None and "Visits" in df.columns and len(df) > 4:
+                    # Work on the columns directly rather than materializing DataFrame rows/slices
+                    visits = df["Visits"].to_numpy()
+                    periods = df["Period"]
+                    recent_visits = visits[-1]
+                    recent_date = periods.iat[-1].strftime('%Y-%m-%d')
+                    recent_day_name = periods.iat[-1].strftime('%A')
+                    dashboard_url = f"https://dashboard.pantheon.io/sites/{site_id}#{ENV}/code"
+
+                    # --- Traffic Spike Alert with Fatigue Prevention ---
+                    previous = slice(-6, -1)  # last 5 days before today
+                    if len(visits[previous]) < 3:
+                        previous = slice(None, -1)
+                    prev_visits = visits[previous]
+                    avg_visits = prev_visits.mean()
+
+                    percent_increase = ((recent_visits - avg_visits) / avg_visits) * 100 if avg_visits > 0 else 0
+
+                    alert_date = recent_date
+                    if not already_alerted(alert_log, site_name, "traffic_spike", alert_date):
+                        if avg_visits > 0 and recent_visits > avg_visits * (1 + threshold_percent / 100):
+                            print(f"Anomaly detected for {site_name}! Sending Slack alert...")
+                            logging.info(f"Anomaly detected for {site_name}: {percent_increase:.1f}% increase. Sending alert.")
+                            # Only format the alert details for sites that actually alert
+                            prev_periods = periods.iloc[previous].dt.strftime('%Y-%m-%d')
+                            prev_days = periods.iloc[previous].dt.day_name()
+                            prev_text = "\n".join([f"{d} ({day}): {v:,} visits" for d, day, v in zip(prev_periods, prev_days, prev_visits)])
+                            sparkline = trend_sparkline(visits[-14:])  # last 14 periods
+                            queue_blocks(pending_blocks, anomaly_blocks(
+                                site_name, f"{recent_date} ({recent_day_name})", recent_visits, avg_visits,
+                                percent_increase, threshold_percent, prev_text, sparkline, dashboard_url,
+                            ))
+                            pending_titles.append("Anomalous Traffic Detected!")
+                            mark_alerted(alert_log, site_name, "traffic_spike", alert_date)
                         else:
-                            print(f"No high error rate detected for {site_name}.")
+                            print(f"No anomaly detected for {site_name}.")
+                            logging.info(f"No anomaly detected for {site_name}.")
                     else:
-                        print(f"Already alerted for error rate on {site_name} for {alert_date}.")
-
-                # --- Cache hit ratio alert (unchanged) ---
-                avg_ratio = df["Cache Hit Ratio"].mean() if not df.empty else 0
-                if avg_ratio < 50:
-                    if avg_ratio >= 80:
-                        indicator = "🟢"
-                    elif avg_ratio >= 50:
-                        indicator = "🟡"
-                    else:
-                        indicator = "🔴"
-                    trend_df = df.tail(5)
-                    trend_text = "\n".join([
-                        f"{row['Period'].strftime('%Y-%m-%d')}: {row['Cache Hit Ratio']:.0f}%"
-                        for _, row in trend_df.iterrows()
-                    ])
-                    worst_row = trend_df.loc[trend_df['Cache Hit Ratio'].idxmin()]
-                    worst_text = f"{worst_row['Cache Hit Ratio']:.0f}% ({worst_row['Period'].strftime('%Y-%m-%d')})"
-                    recent_misses = df.iloc[-1]["Cache Misses"]
-                    impact_text = f"{recent_misses:,} extra origin requests (last period)"
-                    cache_blocks = [
-                        {"type": "header", "text": {"type": "plain_text", "text": f"{indicator} Low Cache Efficiency Detected!"}},
-                        {"type": "section", "fields": [
-                            {"type": "mrkdwn", "text": f"*Site:*\n{site_name} ({ENV})"},
-                            {"type": "mrkdwn", "text": f"*Average Cache Hit Ratio:*\n{avg_ratio:.2f}%"},
-                            {"type": "mrkdwn", "text": "*Threshold:*\n50%"},
-                            {"type": "mrkdwn", "text": f"*Origin Requests:*\n{impact_text}"},
-                        ]},
-                        {"type": "section", "text": {"type": "mrkdwn", "text": f"*Recent Cache Hit Ratios:*\n{trend_text}"}},
-                        {"type": "section", "text": {"type": "mrkdwn", "text": f"*Lowest Ratio in Last 5 Periods:* {worst_text}"}},
-                        {"type": "section", "text": {"type": "mrkdwn", "text": (
-                            "*How to improve caching efficiency:*\n"
-                            "• Ensure static assets (images, CSS, JS) are cacheable and have long cache lifetimes.\n"
-                            "• Review HTTP headers (`Cache-Control`, `Expires`).\n"
-                            "• Avoid unnecessary cache bypass for dynamic pages.\n"
-                            "• Use Pantheon’s [Advanced Page Cache](https://pantheon.io/docs/advanced-page-cache).\n"
-                            "• Avoid uncacheable cookies or query parameters.\n"
-                            "• Audit for personalized content and use `Vary` headers if needed."
-                        )}},
-                        {"type": "section", "text": {"type": "mrkdwn", "text": f"<{dashboard_url}|View in Pantheon Dashboard>"}}
-                    ]
-                    print(f"Low cache efficiency detected for {site_name}! Sending Slack alert...")
-                    logging.info(f"Low cache efficiency detected for {site_name}: {avg_ratio:.2f}%. Sending alert.")
-                    send_slack_notification("Low Cache Efficiency Detected!", blocks=cache_blocks)
-
-            else:
-                print(f"Could not parse metrics for {site_name}.")
-                logging.warning(f"Could not parse metrics for {site_name}.")
+                        print(f"Already alerted for traffic spike on {site_name} for {alert_date}.")
+
+                    # --- Error/Status Monitoring with Fatigue Prevention ---
+                    if "HTTP 4xx" in df.columns and "HTTP 5xx" in df.columns:
+                        recent_4xx = df["HTTP 4xx"].iat[-1]
+                        recent_5xx = df["HTTP 5xx"].iat[-1]
+                        error_alert_type = "error_rate"
+                        error_threshold_4xx = 100  # Adjust as needed
+                        error_threshold_5xx = 10   # Adjust as needed
+                        if not already_alerted(alert_log, site_name, error_alert_type, alert_date):
+                            if recent_4xx > error_threshold_4xx or recent_5xx > error_threshold_5xx:
+                                queue_blocks(pending_blocks, error_rate_blocks(
+                                    site_name, f"{recent_date} ({recent_day_name})", recent_4xx, recent_5xx, dashboard_url,
+                                ))
+                                pending_titles.append("High Error Rate Detected!")
+                                mark_alerted(alert_log, site_name, error_alert_type, alert_date)
+                            else:
+                                print(f"No high error rate detected for {site_name}.")
+                        else:
+                            print(f"Already alerted for error rate on {site_name} for {alert_date}.")
+
+                    # --- Cache hit ratio alert with Fatigue Prevention ---
+                    avg_ratio = df["Cache Hit Ratio"].mean() if not df.empty else 0
+                    if avg_ratio < 50:
+                        if not already_alerted(alert_log, site_name, "cache_efficiency", alert_date):
+                            if avg_ratio >= 80:
+                                indicator = "🟢"
+                            elif avg_ratio >= 50:
+                                indicator = "🟡"
+                            else:
+                                indicator = "🔴"
+                            trend_df = df.tail(5)
+                            trend_text = "\n".join([
+                                f"{row['Period'].strftime('%Y-%m-%d')}: "
+                                + (f"{row['Cache Hit Ratio']:.0f}%" if pd.notna(row['Cache Hit Ratio']) else "no traffic")
+                                for _, row in trend_df.iterrows()
+                            ])
+                            trend_ratios = trend_df['Cache Hit Ratio'].dropna()
+                            if trend_ratios.empty:
+                                worst_text = "no traffic"
+                            else:
+                                worst_row = trend_df.loc[trend_ratios.idxmin()]
+                                worst_text = f"{worst_row['Cache Hit Ratio']:.0f}% ({worst_row['Period'].strftime('%Y-%m-%d')})"
+                            recent_misses = df["Cache Misses"].iat[-1]
+                            impact_text = f"{recent_misses:,} extra origin requests (last period)"
+                            print(f"Low cache efficiency detected for {site_name}! Sending Slack alert...")
+                            logging.info(f"Low cache efficiency detected for {site_name}: {avg_ratio:.2f}%. Sending alert.")
+                            queue_blocks(pending_blocks, cache_efficiency_blocks(
+                                site_name, indicator, avg_ratio, impact_text, trend_text, worst_text, dashboard_url,
+                            ))
+                            pending_titles.append("Low Cache Efficiency Detected!")
+                            mark_alerted(alert_log, site_name, "cache_efficiency", alert_date)
+                        else:
+                            print(f"Already alerted for cache efficiency on {site_name} for {alert_date}.")
+
+                    # --- One combined Slack message per site ---
+                    if pending_blocks:
+                        send_slack_notification(f"{site_name}: " + " ".join(pending_titles), blocks=pending_blocks[:SLACK_MAX_BLOCKS])
+                else:
+                    print(f"Could not parse metrics for {site_name}.")
+                    logging.warning(f"Could not parse metrics for {site_name}.")
         print("Metrics monitoring script finished.")
         logging.info("Script finished.")
     except Exception as e:
@@ -322,6 +492,66 @@ def monitor_sites():
         print("An error occurred! Sending Slack alert.")
         logging.error(f"Unhandled exception: {traceback.format_exc()}")
         send_slack_notification(error_message)
+    finally:
+        # Persist the alert log once per run, even if a site check blew up part way through
+        if alert_log is not None:
+            save_alert_log(alert_log)
+
+def watch_sites(poll_interval):
+    # Long-running mode: one process (and one set of imports) for many checks, config reloaded on change
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    yaml_path = os.path.abspath(YAML_FILE)
+    state = {"config": None, "dirty": True}
+
+    class ConfigChangeHandler(FileSystemEventHandler):
+        def on_modified(self, event):
+            if os.path.abspath(event.src_path) == yaml_path:
+                state["dirty"] = True
+
+        on_created = on_modified
+
+        def on_moved(self, event):
+            # Editors that save via a temp file and rename only show up as a move onto sites.yaml
+            if os.path.abspath(event.dest_path) == yaml_path:
+                state["dirty"] = True
+
+    def tick():
+        if state["dirty"]:
+            try:
+                state["config"] = load_config(YAML_FILE)
+                state["dirty"] = False
+                logging.info(f"Loaded configuration from {YAML_FILE}.")
+            except Exception as e:
+                logging.error(f"Error loading {YAML_FILE}, keeping previous configuration: {e}")
+                print(f"Error loading {YAML_FILE}, keeping previous configuration: {e}")
+        if state["config"] is not None:
+            monitor_sites(state["config"])
+        scheduler.enter(poll_interval, 1, tick)
+
+    observer = Observer()
+    # Watch the directory, not the file, so replaced files keep being picked up
+    observer.schedule(ConfigChangeHandler(), os.path.dirname(yaml_path))
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+    scheduler.enter(0, 1, tick)
+    observer.start()
+    print(f"Watching {YAML_FILE}; checking sites every {poll_interval} seconds. Press Ctrl+C to stop.")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("Stopping metrics monitoring.")
+    finally:
+        observer.stop()
+        observer.join()
 
 if __name__ == "__main__":
-    monitor_sites()
+    parser = argparse.ArgumentParser(description="Monitor Pantheon site metrics and send Slack alerts.")
+    parser.add_argument("--day", action="store_true", help="Check daily metrics (the default).")
+    parser.add_argument("--watch", action="store_true", help="Keep running and check sites every --interval seconds.")
+    parser.add_argument("--interval", type=int, default=3600, help="Seconds between checks in --watch mode (default: 3600).")
+    args = parser.parse_args()
+    if args.watch:
+        watch_sites(args.interval)
+    else:
+        monitor_sites()